@@ -1,17 +1,38 @@
 import argparse
-import json
+import asyncio
 import os
 import re
+import sys
 import time
-import random
 import tempfile
 import logging
 import traceback
+import warnings
+import functools
+import math
+import contextlib
+import multiprocessing
+import hashlib
+import io
+import mmap
+import sqlite3
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+import numpy as np
+import orjson
+from lxml import etree
 from pptx import Presentation
+from pptx.oxml.ns import nsmap, qn
 from PIL import Image
 import pytesseract
+try:
+    from tesserocr import PyTessBaseAPI, PSM
+except ImportError:  # Needs Tesseract's headers to build; fall back to the tesseract CLI
+    PyTessBaseAPI = None
 import google.generativeai as genai
-from google.api_core import exceptions
+from google.generativeai import caching
+from google.api_core import exceptions, retry_async
 
 # Configure logging
 logging.basicConfig(
@@ -28,7 +49,6 @@ if not GENAI_API_KEY:
     raise ValueError("GOOGLE_API_KEY environment variable not set")
 
 genai.configure(api_key=GENAI_API_KEY)
-MODEL = genai.GenerativeModel('gemini-1.5-flash-latest')
 
 FINAL_PROMPT = """
 Analyze this PowerPoint presentation for factual/logical inconsistencies with focus on:
@@ -57,175 +77,817 @@ MEDIUM = Minor numerical mismatches or missing context
 LOW = Presentation inconsistencies without material impact
 
 If no issues: {"inconsistencies": []}
+
+Lines repeated across many slides (footers, disclaimers) are listed once under SHARED LINES
+and appear in slides as [SHARED_n] references. Treat each reference as its full text, and
+quote the full text rather than the reference in evidence.
 """
 
-def extract_pptx_content(pptx_path):
-    """Enhanced extraction with detailed logging"""
+# The invariant prompt rides along as a system instruction; see get_model() for context caching.
+MODEL_NAME = 'gemini-1.5-flash-latest'
+CACHED_MODEL_NAME = 'models/gemini-1.5-flash-001'  # Context caching needs an explicit model version
+MODEL = genai.GenerativeModel(MODEL_NAME, system_instruction=FINAL_PROMPT)
+PROMPT_CACHE_MIN_TOKENS = 2048
+PROMPT_CACHE_TTL = 3600  # seconds
+PROMPT_CACHE_REFRESH_MARGIN = 120  # Recreate the cache this many seconds before it expires
+API_RETRY = retry_async.AsyncRetry(
+    predicate=retry_async.if_exception_type(
+        exceptions.ResourceExhausted, exceptions.ServiceUnavailable, exceptions.InternalServerError
+    ),
+    initial=10,
+    maximum=60,
+    multiplier=2,
+    timeout=180,
+    on_error=lambda e: logger.warning(f"API call failed ({type(e).__name__}), backing off before retrying..."),
+)
+MAX_CONCURRENT_API = 5  # Gemini calls in flight at once in directory mode
+
+# Response parsing
+_JSON_FENCE_RE = re.compile(r'```(?:json)?\s*(\{.*?\})\s*```', re.DOTALL)
+
+# Semantic response cache
+EMBEDDING_MODEL = 'models/text-embedding-004'
+EMBEDDING_CHUNK_CHARS = 6000  # Comfortably under text-embedding-004's 2,048-token input limit
+EMBEDDING_BATCH_SIZE = 100  # Most texts a single embedding request accepts
+SEMANTIC_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "ppt_analyzer", "semantic.sqlite3")
+SEMANTIC_CACHE_THRESHOLD = 0.97  # Cosine similarity needed to reuse a stored result
+
+# Payload compression
+SHARED_LINE_MIN_FRACTION = 0.5  # Lines on at least this share of slides are sent once, by reference
+SHARED_LINE_MIN_CHARS = 20  # Shorter lines aren't worth a [SHARED_n] reference
+
+# OCR settings
+OCR_CONFIG = "--psm 6"
+OCR_BATCH_SIZE = 200  # Very long image lists have been reported to deadlock Tesseract
+MIN_IMAGE_PIXELS = 10_000  # Smaller images are treated as decorative and never OCR'd
+OCR_MAX_SIDE = 2000  # Larger images are downscaled before OCR
+OCR_UPSCALE_BELOW = 1000  # Smaller images are upscaled 2x; Tesseract is tuned for ~300 DPI text
+MAX_IMAGE_PIXELS = 50_000_000  # Images still larger after JPEG draft scaling are skipped rather than decoded
+OCR_CACHE_KEY = f"{OCR_CONFIG};L;{OCR_MAX_SIDE};{OCR_UPSCALE_BELOW};draft".encode()  # Settings that change OCR output
+EXTRACTION_VERSION = 1  # Bump when extraction output changes, so stale .extracted.json sidecars are ignored
+OCR_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "ppt_analyzer", "ocr")
+
+_tess_api = None  # Per-process tesserocr engine, see _get_tess_api()
+
+def _init_worker(log_level):
+    """Propagate the parent's log level into extraction worker processes"""
+    logger.setLevel(log_level)
+
+@functools.lru_cache(maxsize=4)
+def _load_presentation(pptx_path):
+    """Open a presentation once per worker process and reuse it across slides"""
+    return Presentation(pptx_path)
+
+# Text frames, tables and pictures in document order. Copies under mc:AlternateContent are
+# alternate renderings of one shape, which the python-pptx shape tree skips too.
+_SLIDE_ITEMS = etree.XPath(
+    "(.//p:sp | .//a:tbl | .//p:pic)[not(ancestor::mc:AlternateContent)]",
+    namespaces={**nsmap("a", "p"), "mc": "http://schemas.openxmlformats.org/markup-compatibility/2006"},
+)
+
+def _paragraph_text(p):
+    """Same as python-pptx's _Paragraph.text: runs and fields in order, with "\\v" for each <a:br/>"""
+    return "".join(
+        "\v" if child.tag == qn("a:br") else "".join(child.xpath("./a:t/text()"))
+        for child in p.xpath("./a:r | ./a:br | ./a:fld")
+    )
+
+def _paragraphs_text(paragraphs, sep):
+    """Join the non-empty text of <a:p> elements"""
+    texts = (_paragraph_text(p) for p in paragraphs)
+    return sep.join(t for t in texts if t)
+
+def _process_slide(pptx_path, idx, image_dir, min_image_pixels=MIN_IMAGE_PIXELS):
+    """Extract text and tables from a single slide, dumping its images into image_dir"""
+    prs = _load_presentation(pptx_path)
+    slide = prs.slides[idx]
+    slide_num = idx + 1
+    content = []
+    images = []
+    logger.debug(f"Processing slide {slide_num}")
+    
+    # Preserve slide title if exists; each .title access re-searches the shape tree, so look it up once
+    title_shape = slide.shapes.title
+    title_elm = title_shape._element if title_shape else None
+    if title_shape and title_shape.text.strip():
+        title = title_shape.text.strip()
+        content.append(f"TITLE: {title}")
+        logger.debug(f" - Title: {title}")
+    
+    # Text frames, tables and pictures straight from the slide XML, in document order, without
+    # building python-pptx shape/paragraph proxies; lxml does the walking in C
+    for elm in _SLIDE_ITEMS(slide.element):
+        if elm.tag == qn("a:tbl"):
+            table_text = []
+            for tr in elm.xpath("./a:tr"):
+                row_data = [_paragraphs_text(tc.xpath("./a:txBody/a:p"), "\n").strip() for tc in tr.xpath("./a:tc")]
+                table_text.append(" | ".join(row_data))
+            table_content = "TABLE: " + "\n".join(table_text)
+            content.append(table_content)
+            logger.debug(f" - Table: {table_content[:50]}...")
+        
+        # Images are only dumped here; OCR runs later in one batched Tesseract call
+        elif elm.tag == qn("p:pic"):
+            # Linked (not embedded) images have no blob; movies only carry a poster frame
+            rIds = elm.xpath("./p:blipFill/a:blip/@r:embed")
+            if not rIds or elm.xpath("./p:nvPicPr/p:nvPr/a:videoFile"):
+                continue
+            blob = slide.part.related_part(rIds[0]).blob
+            image_hash = hashlib.blake2b(blob, key=OCR_CACHE_KEY).hexdigest()
+            ocr_text = _read_ocr_cache(image_hash)
+            if ocr_text is not None:
+                if ocr_text:
+                    content.append("IMAGE: " + ocr_text)
+                    logger.debug(f" - Cached image text: {ocr_text[:50]}...")
+                continue
+            
+            # Content-addressed names also dedupe images repeated within the deck
+            image_path = os.path.join(image_dir, f"{image_hash}.png")
+            if not os.path.exists(image_path):
+                # Decode in memory so a blob PIL can't read (EMF, WMF, ...) never lands
+                # in a batch, where it would misalign or fail the whole list. Anything that
+                # goes wrong here (decompression bombs, truncated data, a full disk) only
+                # costs this image, never the deck.
+                try:
+                    # Check structure and checksums without allocating a pixel buffer. PIL's bomb
+                    # warning only sees the header size; MAX_IMAGE_PIXELS is applied after draft
+                    # scaling instead, and PIL still refuses anything past twice its own limit.
+                    with warnings.catch_warnings():
+                        warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+                        Image.open(io.BytesIO(blob)).verify()
+                        img = Image.open(io.BytesIO(blob))
+                    # JPEGs larger than the OCR target decode at 1/2-1/8 scale straight away
+                    img.draft(None, (OCR_MAX_SIDE, OCR_MAX_SIDE))
+                    if img.width * img.height > MAX_IMAGE_PIXELS:
+                        logger.warning(f"Skipping oversized {img.width}x{img.height} image on slide {slide_num}")
+                        continue
+                    if _is_decorative(img, min_image_pixels):
+                        logger.debug(f" - Skipping decorative {img.width}x{img.height} image")
+                        continue
+                    img = _preprocess_image(img)
+                    tmp_path = f"{image_path}.{os.getpid()}.tmp"
+                    img.save(tmp_path, format="PNG")
+                    os.replace(tmp_path, image_path)
+                except Exception as e:
+                    logger.warning(f"Skipping unreadable image on slide {slide_num}: {str(e)}")
+                    continue
+            images.append(image_path)
+            content.append(None)  # Placeholder for OCR text
+        
+        elif elm is not title_elm:  # Skip title since we already captured it
+            text = _paragraphs_text(elm.xpath("./p:txBody/a:p"), " | ")
+            if text:
+                content.append(text)
+                logger.debug(f" - Text: {text[:50]}...")
+    
+    return slide_num, content, images
+
+def _is_decorative(img, min_pixels):
+    """Icons, bullets and flat-color rules that would only OCR to nothing or noise"""
+    if img.width * img.height < min_pixels:
+        return True
+    # Single-color fills; getcolors is a cheap histogram lookup for these modes
+    return img.mode in ("1", "L", "P") and img.getcolors(maxcolors=1) is not None
+
+def _preprocess_image(img):
+    """Flatten to grayscale and bring the image toward the scale Tesseract is tuned for"""
+    # Composite transparency onto white; a bare convert('L') turns transparent pixels black
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        img = Image.alpha_composite(Image.new("RGBA", img.size, "white"), img.convert("RGBA"))
+    img = img.convert("L")
+    
+    if max(img.size) > OCR_MAX_SIDE:
+        img.thumbnail((OCR_MAX_SIDE, OCR_MAX_SIDE), Image.LANCZOS)
+    elif max(img.size) < OCR_UPSCALE_BELOW:
+        img = img.resize((img.width * 2, img.height * 2), Image.LANCZOS)
+    return img
+
+def _ocr_cache_path(image_hash):
+    return os.path.join(OCR_CACHE_DIR, f"{image_hash}.txt")
+
+def _read_ocr_cache(image_hash):
+    """Return cached OCR text for an image hash, or None on a miss"""
+    try:
+        with open(_ocr_cache_path(image_hash), encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        return None
+
+def _write_ocr_cache(image_hash, text):
+    """Atomically persist OCR text so concurrent runs never see a partial entry"""
+    cache_path = _ocr_cache_path(image_hash)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(OCR_CACHE_DIR, exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logger.warning(f"Could not write OCR cache entry {image_hash}: {str(e)}")
+
+def _get_tess_api():
+    """One in-process Tesseract engine per worker, so the model is loaded once rather than per image.
+    
+    Returns None if the engine can't start (typically missing or mismatched tessdata).
+    """
+    global _tess_api
+    if _tess_api is None:
+        try:
+            _tess_api = PyTessBaseAPI(psm=PSM.SINGLE_BLOCK)  # Same page segmentation as OCR_CONFIG
+        except Exception as e:
+            logger.warning(f"Could not start tesserocr, falling back to the tesseract CLI: {str(e)}")
+            _tess_api = False  # Don't retry in this worker
+    return _tess_api if _tess_api is not False else None
+
+def _ocr_batch(image_paths, list_path):
+    """OCR many images in one worker: in-process via tesserocr, else one Tesseract run over an image-list file"""
+    api = _get_tess_api() if PyTessBaseAPI is not None else None
+    if api is not None:
+        texts = []
+        for path in image_paths:
+            try:
+                api.SetImageFile(path)
+                texts.append(api.GetUTF8Text().strip())
+            except Exception as e:
+                logger.warning(f"OCR error on {os.path.basename(path)}: {str(e)}")
+                texts.append(None)
+        return texts
+    
+    try:
+        with open(list_path, "w") as f:
+            f.write("\n".join(image_paths) + "\n")
+        
+        # Tesseract terminates each page's text with a form feed
+        pages = pytesseract.image_to_string(list_path, config=OCR_CONFIG).split("\x0c")
+        if len(pages) < len(image_paths):
+            logger.warning(f"Batched OCR returned {len(pages)} pages for {len(image_paths)} images, falling back to per-image OCR")
+            pages = [pytesseract.image_to_string(path, config=OCR_CONFIG) for path in image_paths]
+        
+        return [page.strip() for page in pages[:len(image_paths)]]
+    except Exception as e:
+        # Tesseract errors don't pickle cleanly, so report them from the worker
+        logger.warning(f"OCR error on {len(image_paths)} images: {str(e)}")
+        return [None] * len(image_paths)
+
+def _make_executor(max_workers=None):
+    # Pools are driven from worker threads, and forking a threaded process can copy a held
+    # lock (e.g. logging's) into the child; forkserver/spawn start from a clean interpreter
+    start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return ProcessPoolExecutor(
+        max_workers=max_workers or os.cpu_count(),
+        mp_context=multiprocessing.get_context(start_method),
+        initializer=_init_worker,
+        initargs=(logger.getEffectiveLevel(),),
+    )
+
+def _sidecar_path(pptx_path):
+    return f"{pptx_path}.extracted.json"
+
+def _sidecar_key(pptx_path, min_image_pixels):
+    """Identify a deck revision by mtime and size, plus the code and settings that change extraction output"""
+    st = os.stat(pptx_path)
+    return f"{EXTRACTION_VERSION}:{st.st_mtime_ns}:{st.st_size}:{min_image_pixels}:{OCR_CACHE_KEY.decode()}"
+
+def _read_sidecar(pptx_path, key):
+    """Return cached (slide_num, content) pairs if the sidecar matches this deck revision, else None"""
+    try:
+        with open(_sidecar_path(pptx_path), "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            with memoryview(mm) as view:
+                meta = orjson.loads(view)
+    except (OSError, ValueError):  # Missing, empty, or corrupt sidecar; JSONDecodeError is a ValueError
+        return None
+    if not isinstance(meta, dict) or meta.get("key") != key:
+        return None
+    return [(slide_num, content) for slide_num, content in meta["slides"]]
+
+def _write_sidecar(pptx_path, key, slides):
+    """Atomically persist extracted slides next to the deck"""
+    sidecar_path = _sidecar_path(pptx_path)
+    tmp_path = f"{sidecar_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(orjson.dumps({"key": key, "slides": slides}))
+        os.replace(tmp_path, sidecar_path)
+    except OSError as e:
+        logger.warning(f"Could not write extraction cache {sidecar_path}: {str(e)}")
+
+def extract_pptx_content(pptx_path, max_workers=None, min_image_pixels=MIN_IMAGE_PIXELS, executor=None):
+    """Enhanced extraction with detailed logging, fanned out across processes per slide.
+    
+    Yields (slide_num, content) pairs in slide order. Pass a shared executor to
+    extract several decks on one pool; otherwise a pool is created per call.
+    Results are cached in a <deck>.extracted.json sidecar, reused while the deck is unchanged.
+    Runs where OCR failed for any image aren't cached, so the next run retries them.
+    """
+    key = _sidecar_key(pptx_path, min_image_pixels)
+    cached = _read_sidecar(pptx_path, key)
+    if cached is not None:
+        logger.info(f"Using cached extraction from {_sidecar_path(pptx_path)}")
+        yield from cached
+        return
+    
+    slides = []
+    ocr_failed = []
+    for slide_num, content in _extract_slides(pptx_path, max_workers, min_image_pixels, executor, ocr_failed):
+        slides.append((slide_num, content))
+        yield slide_num, content
+    if ocr_failed:
+        logger.info(f"Not caching extraction: OCR failed for {len(ocr_failed)} images")
+    else:
+        _write_sidecar(pptx_path, key, slides)
+
+def _extract_slides(pptx_path, max_workers, min_image_pixels, executor, ocr_failed):
+    """Extract and OCR every slide; paths of images whose OCR failed are appended to ocr_failed"""
     try:
         logger.info(f"Opening presentation: {pptx_path}")
-        prs = Presentation(pptx_path)
-        slide_data = {}
-        logger.info(f"Presentation contains {len(prs.slides)} slides")
+        slide_count = len(Presentation(pptx_path).slides)
+        logger.info(f"Presentation contains {slide_count} slides")
         
-        for i, slide in enumerate(prs.slides):
-            slide_num = i + 1
-            content = []
-            logger.debug(f"Processing slide {slide_num}")
-            
-            # Preserve slide title if exists
-            if slide.shapes.title and slide.shapes.title.text.strip():
-                title = slide.shapes.title.text.strip()
-                content.append(f"TITLE: {title}")
-                logger.debug(f" - Title: {title}")
+        with tempfile.TemporaryDirectory(prefix="ppt_analyzer_") as image_dir, (
+            _make_executor(max_workers) if executor is None else contextlib.nullcontext(executor)
+        ) as executor:
+            # Shapes aren't picklable, so each worker re-opens the deck and indexes its slide
+            extracted = {}
+            futures = [executor.submit(_process_slide, pptx_path, idx, image_dir, min_image_pixels) for idx in range(slide_count)]
+            for future in as_completed(futures):
+                slide_num, content, images = future.result()
+                extracted[slide_num] = (content, images)
             
-            for shape in slide.shapes:
-                if shape == slide.shapes.title:
-                    continue  # Skip title since we already captured it
-                    
-                # Text frames
-                if shape.has_text_frame:
-                    text = " | ".join(p.text for p in shape.text_frame.paragraphs if p.text)
-                    if text:
-                        content.append(text)
-                        logger.debug(f" - Text: {text[:50]}...")
-                
-                # Tables
-                if shape.has_table:
-                    table_text = []
-                    for row in shape.table.rows:
-                        row_data = [cell.text.strip() for cell in row.cells]
-                        table_text.append(" | ".join(row_data))
-                    table_content = "TABLE: " + "\n".join(table_text)
-                    content.append(table_content)
-                    logger.debug(f" - Table: {table_content[:50]}...")
-                
-                # Images
-                if shape.shape_type == 13:  # Picture
-                    with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as tmp:
-                        shape.image.save(tmp.name)
-                        try:
-                            img = Image.open(tmp.name)
-                            ocr_text = pytesseract.image_to_string(img).strip()
-                            if ocr_text:
-                                img_content = "IMAGE: " + ocr_text
-                                content.append(img_content)
-                                logger.debug(f" - Image text: {ocr_text[:50]}...")
-                        except Exception as e:
-                            logger.warning(f"OCR error on slide {slide_num}: {str(e)}")
-                        finally:
-                            os.unlink(tmp.name)
-            
-            slide_data[slide_num] = "\n".join(content)
-            logger.info(f"Extracted {len(content)} elements from slide {slide_num}")
+            # OCR every dumped image in as few Tesseract invocations as possible
+            image_paths = list(dict.fromkeys(path for num in sorted(extracted) for path in extracted[num][1]))
+            ocr_text = {}
+            if image_paths:
+                logger.info(f"Running OCR on {len(image_paths)} images")
+                # In-process OCR has no startup cost to amortize, so spread images across every worker;
+                # still capped, as a worker whose engine fails to start falls back to the CLI
+                batch_size = OCR_BATCH_SIZE if PyTessBaseAPI is None else min(
+                    OCR_BATCH_SIZE, math.ceil(len(image_paths) / executor._max_workers)
+                )
+                batches = [image_paths[i:i + batch_size] for i in range(0, len(image_paths), batch_size)]
+                batch_futures = {
+                    executor.submit(_ocr_batch, batch, os.path.join(image_dir, f"images{n}.txt")): batch
+                    for n, batch in enumerate(batches)
+                }
+                for future in as_completed(batch_futures):
+                    for path, text in zip(batch_futures[future], future.result()):
+                        if text is not None:
+                            ocr_text[path] = text
+                            _write_ocr_cache(os.path.splitext(os.path.basename(path))[0], text)
+                        else:
+                            ocr_failed.append(path)
         
-        return slide_data
+        for slide_num in sorted(extracted):
+            content, images = extracted[slide_num]
+            image_texts = iter(ocr_text.get(path, "") for path in images)
+            elements = []
+            for element in content:
+                if element is None:
+                    text = next(image_texts)
+                    if not text:
+                        continue
+                    element = "IMAGE: " + text
+                    logger.debug(f" - Image text on slide {slide_num}: {text[:50]}...")
+                elements.append(element)
+            
+            logger.info(f"Extracted {len(elements)} elements from slide {slide_num}")
+            yield slide_num, "\n".join(elements)
     
     except Exception as e:
         logger.error(f"Extraction failed: {str(e)}")
         logger.error(traceback.format_exc())
         raise
 
-def analyze_slides(slide_data):
-    """Enhanced analysis with detailed diagnostics"""
+def _balanced_spans(raw):
+    """Yield (start, end) byte offsets of top-level balanced {...} regions, found with vectorized depth tracking"""
+    arr = np.frombuffer(raw, dtype=np.uint8)
+    opens = arr == ord('{')
+    closes = arr == ord('}')
+    depth = np.cumsum(opens.astype(np.int32) - closes)
+    # Measure depth from the running floor so stray '}' in prose don't hide later objects
+    floor = np.minimum.accumulate(np.concatenate(([0], depth[:-1])))
+    relative = depth - floor
+    starts = np.flatnonzero(opens & (relative == 1))
+    ends = np.flatnonzero(closes & (relative == 0))
+    for start, end_idx in zip(starts, np.searchsorted(ends, starts)):
+        if end_idx < len(ends):
+            yield int(start), int(ends[end_idx])
+
+def _scan_json(raw):
+    """Return the first complete {...} object in raw bytes carrying "inconsistencies", or None.
+    
+    Safe on a partial stream: an object only counts once its closing brace has arrived.
+    """
+    for start, end in _balanced_spans(raw):
+        candidate = raw[start:end + 1]
+        if b'"inconsistencies"' not in candidate:
+            continue
+        try:
+            data = orjson.loads(candidate)
+        except orjson.JSONDecodeError:
+            continue
+        if isinstance(data, dict) and "inconsistencies" in data:
+            return data
+    return None
+
+def _extract_json(text):
+    """Return the first JSON object in text carrying "inconsistencies", or None if there are no braces at all"""
+    # The model usually answers with a single fenced block
+    match = _JSON_FENCE_RE.search(text)
+    if match:
+        try:
+            data = orjson.loads(match.group(1))
+            if isinstance(data, dict) and "inconsistencies" in data:
+                return data
+        except orjson.JSONDecodeError:
+            pass  # Fall through to the brace scan
+    
+    data = _scan_json(text.encode())
+    if data is not None:
+        return data
+    
+    # Braces inside string values can throw the scan off. Fall back to the widest {...} slice and let decode errors surface to the caller
+    start_idx = text.find('{')
+    end_idx = text.rfind('}')
+    if start_idx == -1 or end_idx == -1:
+        return None
+    return orjson.loads(text[start_idx:end_idx + 1])
+
+class SemanticCache:
+    """SQLite-backed store of analysis results, matched on slide-content embedding similarity.
+    
+    The payload is embedded in chunks that fit the embedding model's input limit, and a
+    stored deck only counts as a hit when every chunk lines up above the threshold, so an
+    edit anywhere in the deck is seen. Entries are also keyed on the generation model and
+    prompt, so changing either never serves answers produced under the old one.
+    """
+    
+    def __init__(self, path=SEMANTIC_CACHE_PATH, threshold=SEMANTIC_CACHE_THRESHOLD):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.threshold = threshold
+        self.generation_key = hashlib.blake2b(f"{MODEL_NAME}\0{CACHED_MODEL_NAME}\0{FINAL_PROMPT}".encode()).hexdigest()
+        # Opened off the event loop in main(); afterwards only the loop thread touches it
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS analyses ("
+                "content_hash TEXT NOT NULL, generation_key TEXT NOT NULL, "
+                "embedding_model TEXT NOT NULL, chunks INTEGER NOT NULL, "
+                "embedding BLOB NOT NULL, response TEXT NOT NULL, "
+                "PRIMARY KEY (content_hash, generation_key))"
+            )
+    
+    @staticmethod
+    async def embed(content):
+        """Unit-normalized (chunks, dim) embeddings, so dot products are cosine similarities"""
+        chunks = [content[i:i + EMBEDDING_CHUNK_CHARS] for i in range(0, len(content), EMBEDDING_CHUNK_CHARS)] or [""]
+        vectors = []
+        for i in range(0, len(chunks), EMBEDDING_BATCH_SIZE):
+            result = await genai.embed_content_async(model=EMBEDDING_MODEL, content=chunks[i:i + EMBEDDING_BATCH_SIZE])
+            vectors.extend(result["embedding"])
+        embedding = np.asarray(vectors, dtype=np.float32)
+        return embedding / np.linalg.norm(embedding, axis=1, keepdims=True)
+    
+    def _content_hash(self, content):
+        return hashlib.blake2b(content.encode()).hexdigest()
+    
+    async def lookup(self, content):
+        """Return (inconsistencies, embedding); inconsistencies is None on a miss"""
+        row = self.conn.execute(
+            "SELECT response FROM analyses WHERE content_hash = ? AND generation_key = ?",
+            (self._content_hash(content), self.generation_key),
+        ).fetchone()
+        if row:
+            logger.info("Semantic cache hit (exact content match)")
+            return orjson.loads(row[0]), None
+        
+        embedding = await self.embed(content)
+        rows = self.conn.execute(
+            "SELECT embedding, response FROM analyses "
+            "WHERE generation_key = ? AND embedding_model = ? AND chunks = ?",
+            (self.generation_key, EMBEDDING_MODEL, len(embedding)),
+        ).fetchall()
+        if rows:
+            stored = np.frombuffer(b"".join(r[0] for r in rows), dtype=np.float32).reshape(len(rows), *embedding.shape)
+            # A deck is only as similar as its least similar chunk
+            similarities = np.einsum("rcd,cd->rc", stored, embedding).min(axis=1)
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.threshold:
+                logger.info(f"Semantic cache hit (similarity {similarities[best]:.4f})")
+                return orjson.loads(rows[best][1]), embedding
+            logger.debug(f"Semantic cache miss (best similarity {similarities[best]:.4f})")
+        
+        return None, embedding
+    
+    async def store(self, content, embedding, inconsistencies):
+        if embedding is None:
+            embedding = await self.embed(content)
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO analyses VALUES (?, ?, ?, ?, ?, ?)",
+                (self._content_hash(content), self.generation_key, EMBEDDING_MODEL, len(embedding),
+                 embedding.astype(np.float32).tobytes(), orjson.dumps(inconsistencies).decode()),
+            )
+
+def _create_model():
+    """Return (model, expires_at) bound to a cached FINAL_PROMPT, or the plain model when caching doesn't apply"""
+    prompt_tokens = len(FINAL_PROMPT) // 4  # 1 token ≈ 4 characters
+    if prompt_tokens < PROMPT_CACHE_MIN_TOKENS:
+        logger.debug(f"Prompt below context caching minimum ({prompt_tokens} estimated tokens), sending inline")
+        return MODEL, math.inf
+    
     try:
-        # Build full presentation content
-        full_content = "\n\n".join(
-            [f"--- SLIDE {num} ---\n{content}" 
-             for num, content in slide_data.items()]
+        expires_at = time.monotonic() + PROMPT_CACHE_TTL - PROMPT_CACHE_REFRESH_MARGIN
+        cache = caching.CachedContent.create(
+            model=CACHED_MODEL_NAME,
+            system_instruction=FINAL_PROMPT,
+            ttl=PROMPT_CACHE_TTL,
         )
+        logger.info(f"Created prompt cache {cache.name}")
+        return genai.GenerativeModel.from_cached_content(cached_content=cache), expires_at
+    except Exception as e:
+        logger.warning(f"Prompt caching unavailable, sending prompt inline: {str(e)}")
+        return MODEL, math.inf
+
+_model = None
+_model_expires_at = 0.0
+_model_lock = None
+
+async def get_model():
+    """Return the analysis model, creating the prompt cache once and recreating it before its TTL runs out"""
+    global _model, _model_expires_at, _model_lock
+    if _model_lock is None:
+        _model_lock = asyncio.Lock()
+    # Concurrent callers (a pre-warm plus every deck in batch mode) wait on a single creation
+    async with _model_lock:
+        if _model is None or time.monotonic() >= _model_expires_at:
+            _model, _model_expires_at = await asyncio.to_thread(_create_model)
+    return _model
+
+def _share_repeated_lines(slides):
+    """Replace lines repeated on at least half the slides with [SHARED_n] references.
+    
+    Returns (legend, slides), where legend defines each reference and is empty when no line qualifies.
+    """
+    slide_lines = [(num, content.split("\n")) for num, content in slides]
+    counts = Counter(line for _, lines in slide_lines for line in dict.fromkeys(lines))  # Ordered, so references are stable
+    threshold = max(2, SHARED_LINE_MIN_FRACTION * len(slide_lines))
+    references = {}
+    for line, count in counts.most_common():
+        if count < threshold:
+            break
+        if len(line.strip()) >= SHARED_LINE_MIN_CHARS:
+            references[line] = f"[SHARED_{len(references) + 1}]"
+    
+    if references:
+        logger.info(f"Sending {len(references)} lines shared across slides by reference")
+    legend = "\n".join(f"{ref} = {line}" for line, ref in references.items())
+    return legend, [(num, "\n".join(references.get(line, line) for line in lines)) for num, lines in slide_lines]
+
+async def _pump_stream(response, queue):
+    """Feed streamed response text into queue, then None, or the exception that ended the stream"""
+    try:
+        async for chunk in response:
+            if chunk.parts:
+                queue.put_nowait(chunk.text)
+        queue.put_nowait(None)
+    except Exception as e:
+        queue.put_nowait(e)
+
+async def analyze_slides(slide_data, semantic_cache=None, response_path="gemini_response.txt"):
+    """Enhanced analysis with detailed diagnostics, optionally short-circuited by a SemanticCache.
+    
+    slide_data is a {slide_num: content} dict or any iterable of (slide_num, content) pairs.
+    The raw model response is saved to response_path for debugging. Returns the list of
+    inconsistencies, or None if the API call failed or its response couldn't be parsed.
+    """
+    try:
+        # Build full presentation content, with boilerplate lines sent once up front
+        if isinstance(slide_data, dict):
+            slide_data = slide_data.items()
+        legend, slide_data = _share_repeated_lines(slide_data)
+        buf = io.StringIO()
+        if legend:
+            buf.write(f"--- SHARED LINES ---\n{legend}")
+        for num, content in slide_data:
+            if buf.tell():
+                buf.write("\n\n")
+            buf.write(f"--- SLIDE {num} ---\n")
+            buf.write(content)
+        full_content = buf.getvalue()
+        
+        # Near-duplicate decks skip the Gemini round trip entirely
+        embedding = None
+        if semantic_cache:
+            try:
+                cached, embedding = await semantic_cache.lookup(full_content)
+                if cached is not None:
+                    return cached
+            except Exception as e:
+                logger.warning(f"Semantic cache lookup failed: {str(e)}")
         
         # Log token estimate
         token_estimate = len(full_content) // 4  # 1 token ≈ 4 characters
         logger.info(f"Sending content to Gemini ({token_estimate} estimated tokens)")
         
-        # API call with retries
-        for attempt in range(3):
+        # API call; quota and transient server errors are retried with backoff by the client.
+        # The response is streamed so parsing can finish as soon as the JSON object closes,
+        # without waiting for trailing tokens (closing fences, commentary).
+        raw = bytearray()
+        data = None
+        try:
+            model = await get_model()
+            response = await model.generate_content_async(
+                full_content, stream=True, request_options={"retry": API_RETRY}
+            )
+            queue = asyncio.Queue()
+            pump = asyncio.create_task(_pump_stream(response, queue))
             try:
-                logger.info(f"API attempt {attempt+1}/3")
-                response = MODEL.generate_content([FINAL_PROMPT, full_content])
-                logger.info("Received response from Gemini API")
-                
-                # Log response for debugging
-                with open("gemini_response.txt", "w") as f:
-                    f.write(response.text)
-                logger.info("Saved raw response to gemini_response.txt")
-                
-                # Try to extract JSON
-                start_idx = response.text.find('{')
-                end_idx = response.text.rfind('}')
-                if start_idx == -1 or end_idx == -1:
-                    logger.error("No JSON found in response")
-                    return []
-                
-                json_str = response.text[start_idx:end_idx+1]
-                logger.debug(f"Extracted JSON: {json_str[:200]}...")
-                
-                try:
-                    data = json.loads(json_str)
-                    inconsistencies = data.get("inconsistencies", [])
-                    logger.info(f"Found {len(inconsistencies)} inconsistencies in response")
-                    return inconsistencies
-                except json.JSONDecodeError as e:
-                    logger.error(f"JSON decode error: {str(e)}")
-                    return []
-                
-            except exceptions.ResourceExhausted as e:
-                wait = 10 * (2 ** attempt) + random.uniform(0, 5)
-                logger.warning(f"API quota exceeded. Retrying in {wait:.1f}s...")
-                time.sleep(wait)
-            except Exception as e:
-                logger.error(f"API error: {str(e)}")
-                logger.error(traceback.format_exc())
-                return []
+                while (item := await queue.get()) is not None:
+                    if isinstance(item, Exception):
+                        raise item
+                    raw += item.encode()
+                    data = _scan_json(raw)
+                    if data is not None:
+                        logger.debug("JSON object complete, closing the rest of the stream")
+                        break
+            finally:
+                # The pump is either finished or waiting on its next read, and cancelling a
+                # pending read makes grpc cancel the call, so the model stops generating
+                pump.cancel()
+        except exceptions.RetryError as e:
+            logger.error(f"API call failed after retrying: {str(e)}")
+            return None
+        except Exception as e:
+            logger.error(f"API error: {str(e)}")
+            logger.error(traceback.format_exc())
+            return None
+        logger.info("Received response from Gemini API")
+        text = raw.decode()
+        
+        # Log response for debugging
+        with open(response_path, "w") as f:
+            f.write(text)
+        logger.info(f"Saved raw response to {response_path}")
         
-        logger.error("API call failed after 3 attempts")
-        return []
+        # Try to extract JSON from the whole stream if the incremental scan didn't find it
+        try:
+            if data is None:
+                data = _extract_json(text)
+            if data is None:
+                logger.error("No JSON found in response")
+                return None
+        except orjson.JSONDecodeError as e:
+            logger.error(f"JSON decode error: {str(e)}")
+            return None
+        
+        inconsistencies = data.get("inconsistencies", [])
+        logger.info(f"Found {len(inconsistencies)} inconsistencies in response")
+        if semantic_cache:
+            try:
+                await semantic_cache.store(full_content, embedding, inconsistencies)
+            except Exception as e:
+                logger.warning(f"Semantic cache store failed: {str(e)}")
+        return inconsistencies
     
     except Exception as e:
         logger.error(f"Analysis failed: {str(e)}")
         logger.error(traceback.format_exc())
-        return []
+        return None
 
-def main():
+def _build_output(slide_data, inconsistencies):
+    return {
+        "statistics": {
+            "total_slides": len(slide_data),
+            "issues_found": len(inconsistencies),
+            "analysis_time": time.strftime("%Y-%m-%d %H:%M:%S")
+        },
+        "inconsistencies": inconsistencies
+    }
+
+def _write_output(output, output_path):
+    with open(output_path, "wb") as f:
+        f.write(orjson.dumps(output, option=orjson.OPT_INDENT_2))
+    logger.info(f"Results saved to {output_path}")
+
+async def _analyze_deck(pptx_path, output_dir, executor, semaphore, min_image_pixels, semantic_cache):
+    """Extract one deck on the shared pool, then analyze it once an API slot frees up.
+    
+    Returns True on success; failures are logged rather than raised so other decks keep going.
+    """
+    try:
+        slide_data = await asyncio.to_thread(dict, extract_pptx_content(
+            str(pptx_path), min_image_pixels=min_image_pixels, executor=executor
+        ))
+        async with semaphore:
+            logger.info(f"Analyzing {pptx_path.name} for inconsistencies...")
+            inconsistencies = await analyze_slides(
+                slide_data, semantic_cache=semantic_cache,
+                response_path=output_dir / f"{pptx_path.stem}.response.txt",
+            )
+        if inconsistencies is None:
+            logger.error(f"Failed to analyze {pptx_path}: no usable response from Gemini")
+            return False
+        _write_output(_build_output(slide_data, inconsistencies), output_dir / f"{pptx_path.stem}.json")
+        return True
+    except Exception as e:
+        logger.error(f"Failed to analyze {pptx_path}: {str(e)}")
+        return False
+
+async def analyze_directory(input_dir, output_dir=None, max_workers=None, min_image_pixels=MIN_IMAGE_PIXELS,
+                            max_concurrent_api=MAX_CONCURRENT_API, semantic_cache=None):
+    """Analyze every *.pptx in input_dir, writing <output_dir>/<stem>.json per deck.
+    
+    Returns the number of decks that failed.
+    """
+    # Skip the ~$ lock files PowerPoint leaves next to open decks
+    pptx_paths = sorted(p for p in Path(input_dir).glob("*.pptx") if not p.name.startswith("~$"))
+    logger.info(f"Found {len(pptx_paths)} presentations in {input_dir}")
+    if not pptx_paths:
+        return 0
+    
+    output_dir = Path(output_dir or input_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    
+    # Extraction shares one process pool; Gemini calls are capped to respect rate limits
+    semaphore = asyncio.Semaphore(max_concurrent_api)
+    with _make_executor(max_workers) as executor:
+        _, *succeeded = await asyncio.gather(
+            get_model(),
+            *(_analyze_deck(p, output_dir, executor, semaphore, min_image_pixels, semantic_cache)
+              for p in pptx_paths),
+        )
+    
+    failed = succeeded.count(False)
+    if failed:
+        logger.error(f"{failed} of {len(pptx_paths)} presentations failed")
+    return failed
+
+async def main():
     parser = argparse.ArgumentParser(description="PPTX Consistency Analyzer")
-    parser.add_argument("input", help="Path to PPTX file")
+    input_group = parser.add_mutually_exclusive_group(required=True)
+    input_group.add_argument("input", nargs="?", help="Path to PPTX file")
+    input_group.add_argument("--input-dir", help="Analyze every *.pptx in this directory")
     parser.add_argument("-o", "--output", help="Output JSON file")
+    parser.add_argument("--output-dir", help="Where --input-dir writes <deck>.json results (default: the input directory)")
     parser.add_argument("-v", "--verbose", action="store_true", help="Enable debug logging")
+    parser.add_argument("-j", "--workers", type=int, help="Extraction worker processes (default: CPU count)")
+    parser.add_argument("--max-concurrent-api", type=int,
+                        help=f"Concurrent Gemini calls in --input-dir mode (default: {MAX_CONCURRENT_API})")
+    parser.add_argument("--min-image-pixels", type=int, default=MIN_IMAGE_PIXELS,
+                        help=f"Skip OCR on images with fewer pixels (default: {MIN_IMAGE_PIXELS})")
+    parser.add_argument("--semantic-cache", action="store_true",
+                        help="Reuse results from a previously analyzed near-identical deck")
     args = parser.parse_args()
     
+    if args.input_dir and args.output:
+        parser.error("-o/--output applies to a single file; use --output-dir with --input-dir")
+    if args.input and (args.output_dir or args.max_concurrent_api):
+        parser.error("--output-dir and --max-concurrent-api only apply with --input-dir")
+    
     if args.verbose:
         logger.setLevel(logging.DEBUG)
     
+    if args.input_dir:
+        logger.info(f"Starting batch analysis of: {args.input_dir}")
+        semantic_cache = await asyncio.to_thread(SemanticCache) if args.semantic_cache else None
+        failed = await analyze_directory(
+            args.input_dir, args.output_dir, max_workers=args.workers, min_image_pixels=args.min_image_pixels,
+            max_concurrent_api=args.max_concurrent_api or MAX_CONCURRENT_API, semantic_cache=semantic_cache,
+        )
+        logger.info("Analysis complete")
+        return 1 if failed else 0
+    
     logger.info(f"Starting analysis of: {args.input}")
     
-    # Extraction Phase
+    # Extraction Phase, overlapped with analysis setup: opening the semantic cache database
+    # and, once FINAL_PROMPT is large enough to be cached, creating the prompt cache
     logger.info("Extracting content from slides...")
-    slide_data = extract_pptx_content(args.input)
+    slide_data, _, semantic_cache = await asyncio.gather(
+        asyncio.to_thread(dict, extract_pptx_content(
+            args.input, max_workers=args.workers, min_image_pixels=args.min_image_pixels
+        )),
+        get_model(),
+        asyncio.to_thread(SemanticCache) if args.semantic_cache else asyncio.sleep(0),
+    )
     logger.info(f"Extracted content from {len(slide_data)} slides")
     
     # Analysis Phase
     logger.info("Analyzing for inconsistencies...")
-    inconsistencies = analyze_slides(slide_data)
+    inconsistencies = await analyze_slides(slide_data, semantic_cache=semantic_cache)
+    if inconsistencies is None:
+        logger.error("Analysis failed: no usable response from Gemini")
+        return 1
     logger.info(f"Found {len(inconsistencies)} potential inconsistencies")
     
     # Output Results
-    output = {
-        "statistics": {
-            "total_slides": len(slide_data),
-            "issues_found": len(inconsistencies),
-            "analysis_time": time.strftime("%Y-%m-%d %H:%M:%S")
-        },
-        "inconsistencies": inconsistencies
-    }
-    
+    output = _build_output(slide_data, inconsistencies)
     if args.output:
-        with open(args.output, "w") as f:
-            json.dump(output, f, indent=2)
-        logger.info(f"Results saved to {args.output}")
+        _write_output(output, args.output)
     else:
-        print(json.dumps(output, indent=2))
+        print(orjson.dumps(output, option=orjson.OPT_INDENT_2).decode())
     
     logger.info("Analysis complete")
+    return 0
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(asyncio.run(main()))